@@ -53,7 +53,11 @@ cm.add(Command(
 cm.add(Command(
 	"start",
 	"runs server with gunicorn in a production setting",
-	lambda c: 'gunicorn -b {0}:{1} server:app'.format(c['host'], c['port']),
+	# --preload imports the app (and loads the model) once in the master, so
+	# forked workers share its memory copy-on-write instead of each loading it.
+	# without --workers gunicorn picks the count (WEB_CONCURRENCY, default 1)
+	lambda c: 'gunicorn --preload{2} -b {0}:{1} server:app'.format(
+		c['host'], c['port'], ' -w ' + c['workers'] if c['workers'] else ''),
 	{
 		'FLASK_APP': FLASK_APP,
 		'FLASK_DEBUG': 'false'
@@ -97,6 +101,8 @@ parser = argparse.ArgumentParser(description=cm.availableCommands(),
 parser.add_argument("subcommand", help="subcommand to run (see list above)")
 parser.add_argument("ipaddress", nargs='?', default=DEFAULT_IP,
 					help="address and port to run on (i.e. {0})".format(DEFAULT_IP))
+parser.add_argument("-w", "--workers", type=int,
+					help="number of gunicorn worker processes for start (default: gunicorn's own)")
 def livereload_check():
 	check = subprocess.call("lsof -n -i4TCP:3000", shell=True)
 	if (check == 0):
@@ -116,6 +122,7 @@ try:
 	cm.configure({
 		'host': addr[0],
 		'port': addr[1],
+		'workers': str(args.workers) if args.workers else '',
 	})
 	cm.run(cmd)
 except KeyboardInterrupt:
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+# -*- coding: utf8 -*-
+'''
+Model loading, request validation and the cleaning and discrepancy functions
+shared by the /predict route and the notebooks.
+
+The notebooks load this file on its own, without the flask app, so it must
+not import anything from the server package.
+'''
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import OneHotEncoder
+from schema import Schema, And, Or
+
+import pickle
+import json
+import os
+
+
+path = os.path.dirname(os.path.realpath(__file__))
+abspath = lambda p: os.path.normpath(os.path.join(path, p))
+
+MODEL_PATH = abspath('models/sentence_pipe_mae1.555_2020-10-10_02h46m24s.pkl')
+TEST_DISCREPANCIES_PATH = abspath('models/test_data_percentage_discrepancies.json')
+
+
+def load_model(model_path):
+    '''Load a pickled prediction pipeline.'''
+    with open(model_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_test_discrepancies(discrepancies_path):
+    '''
+    Load test set percentage discrepancies as the sorted array of magnitudes
+    that discrepancy_percentile expects.
+
+    Params:
+        discrepancies_path: (str) path to a plain JSON list of test set percentage 
+        discrepancies.
+    '''
+    with open(discrepancies_path) as f:
+        # should be 1-d array
+        test_discrepancies = np.sort(np.abs(np.array(json.load(f), dtype=np.float64)))
+    test_discrepancies.setflags(write=False)
+    return test_discrepancies
+
+
+model = load_model(MODEL_PATH)
+# the test discrepancies are fixed for a given model, so they are read and
+# sorted once at import rather than on every percentile lookup
+TEST_DISCREPANCIES = load_test_discrepancies(TEST_DISCREPANCIES_PATH)
+
+PREDICT_SCHEMA = Schema({
+    'CHARGE_COUNT': int,
+    'CHARGE_DISPOSITION': And(str, len),
+    'UPDATED_OFFENSE_CATEGORY': And(str, len),
+    'PRIMARY_CHARGE_FLAG': bool,
+    'DISPOSITION_CHARGED_OFFENSE_TITLE': And(str, len),
+    'DISPOSITION_CHARGED_CLASS': And(str, len),
+    'SENTENCE_JUDGE': And(str, len),
+    'SENTENCE_PHASE': And(str, len),
+    'COMMITMENT_TERM': Or(And(str, len), int, float),
+    'COMMITMENT_UNIT': And(str, len),
+    'LENGTH_OF_CASE_in_Days': Or(float, int),
+    'AGE_AT_INCIDENT': Or(float, int),
+    'RACE': And(str, len),
+    'GENDER': And(str, len),
+    'INCIDENT_CITY': Or(And(str, len), None),
+    'LAW_ENFORCEMENT_AGENCY': And(str, len),
+    'LAW_ENFORCEMENT_UNIT': Or(And(str, len), None),
+    'SENTENCE_TYPE': And(str, len)
+})
+
+
+# Per-field checks equivalent to PREDICT_SCHEMA, resolved once at import so a
+# well formed payload is validated with plain isinstance calls. schema does
+# not accept bools for int fields, so neither do these.
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_str(value):
+    return isinstance(value, str) and len(value) > 0
+
+def _is_str_or_none(value):
+    return value is None or _is_str(value)
+
+def _is_str_or_number(value):
+    return _is_str(value) or _is_number(value)
+
+def _is_bool(value):
+    return isinstance(value, bool)
+
+PREDICT_CHECKS = {
+    'CHARGE_COUNT': _is_int,
+    'CHARGE_DISPOSITION': _is_str,
+    'UPDATED_OFFENSE_CATEGORY': _is_str,
+    'PRIMARY_CHARGE_FLAG': _is_bool,
+    'DISPOSITION_CHARGED_OFFENSE_TITLE': _is_str,
+    'DISPOSITION_CHARGED_CLASS': _is_str,
+    'SENTENCE_JUDGE': _is_str,
+    'SENTENCE_PHASE': _is_str,
+    'COMMITMENT_TERM': _is_str_or_number,
+    'COMMITMENT_UNIT': _is_str,
+    'LENGTH_OF_CASE_in_Days': _is_number,
+    'AGE_AT_INCIDENT': _is_number,
+    'RACE': _is_str,
+    'GENDER': _is_str,
+    'INCIDENT_CITY': _is_str_or_none,
+    'LAW_ENFORCEMENT_AGENCY': _is_str,
+    'LAW_ENFORCEMENT_UNIT': _is_str_or_none,
+    'SENTENCE_TYPE': _is_str
+}
+
+
+def validate_payload(payload):
+    '''
+    Validate a request payload against PREDICT_SCHEMA.
+
+    Payloads that pass PREDICT_CHECKS are returned as is. Anything else is
+    handed to PREDICT_SCHEMA.validate, which raises a SchemaError describing
+    what is wrong with it.
+    '''
+    if isinstance(payload, dict) and payload.keys() == PREDICT_CHECKS.keys() \
+            and all(check(payload[k]) for k, check in PREDICT_CHECKS.items()):
+        return payload
+    return PREDICT_SCHEMA.validate(payload)
+
+# Ensure that the data is in the correct order for the model
+# model[0] is a sklearn ColumnTransformer obj
+ORIG_COLS = model[0]._df_columns
+
+
+def _lookup_table(mapping, fill):
+    '''
+    Build a (value -> code) dict and a numpy table of mapped values, so that
+    mapping a column is one numpy gather. Unmapped values get code -1, which
+    selects the trailing fill value.
+    '''
+    index = {k: i for i, k in enumerate(mapping)}
+    table = np.array(list(mapping.values()) + [fill])
+    return index, table
+
+
+def _lookup(values, index, table):
+    '''Map an array of values through a table built by _lookup_table.'''
+    codes = np.fromiter((index.get(v, -1) for v in values), dtype=np.int32, count=len(values))
+    return table[codes]
+
+
+# standardize race category names
+# NB: biracial was just 8 people out of 120k in original data set
+STANDARD_RACE_MAP = {'Black': 'Black',
+                     'White': 'White',
+                     'HISPANIC': 'HISPANIC',
+                     'White [Hispanic or Latino]': 'HISPANIC',
+                     'White/Black [Hispanic or Latino]': 'HISPANIC',
+                     'ASIAN': 'Asian',
+                     'Asian': 'Asian',
+                     'American Indian': 'American Indian',
+                     'Unknown': 'Unknown',
+                     'Biracial': 'Black'}
+# races not included in STANDARD_RACE_MAP become None
+RACE_INDEX, RACE_OUT = _lookup_table(STANDARD_RACE_MAP, None)
+
+# white --> black
+# non-white --> white
+RACE_COUNTERFACTUAL_MAP = {'Black': 'White',
+                           'White': 'Black',
+                           'HISPANIC': 'White',
+                           'Asian': 'White',
+                           'American Indian': 'White'}
+# counterfactual races are gathered by categorical code: CF_PERM[i] is the code
+# of the counterfactual of RACE_CATS[i], and the trailing -1 (the code of any
+# race without a counterfactual) selects None
+RACE_CATS = pd.CategoricalDtype(list(RACE_COUNTERFACTUAL_MAP))
+CF_PERM = np.array([list(RACE_COUNTERFACTUAL_MAP).index(r)
+                    for r in RACE_COUNTERFACTUAL_MAP.values()] + [-1], dtype=np.int8)
+RACE_CATS_OUT = np.array(list(RACE_CATS.categories) + [None], dtype=object)
+
+# divisors to normalize commitment term to year units
+TERM_DIVISORS = {'Year(s)': 1, 'Months': 12, 'Days': 365}
+# fill rows where unit is natural life with divsor==1
+TERM_DIVISOR_INDEX, TERM_DIVISOR_OUT = _lookup_table(TERM_DIVISORS, 1)
+
+# examples with other commitment term units are dropped
+COMMITMENT_TERM_UNITS = ['Year(s)', 'Months', 'Natural Life', 'Days']
+US_LIFE_EXPECTANCY = 78
+# commitment terms are clipped to this many years
+MAX_COMMITMENT_TERM = 110
+
+# cols that had more than 5% nulls, dropped before any null examples are
+NAN_COLS = ['LENGTH_OF_CASE_in_Days', 'INCIDENT_CITY', 'LAW_ENFORCEMENT_UNIT']
+
+# number of categories kept in high cardinality columns
+TOP_NS = {'UPDATED_OFFENSE_CATEGORY': 25, 'DISPOSITION_CHARGED_OFFENSE_TITLE': 40,
+          'LAW_ENFORCEMENT_AGENCY': 20, 'SENTENCE_JUDGE': 73}
+
+# categories each one hot encoded column was fit on
+# model[0].transformers_[0] is the ('cats', OneHotEncoder, columns) transformer
+_, _ohe, _cat_cols = model[0].transformers_[0]
+TRAINING_CATEGORIES = dict(zip(_cat_cols, _ohe.categories_))
+# categories of the TOP_NS cols seen in training, all others were
+# consolidated into 'misc_other' before the model was fit
+TOP_CATEGORIES = {name: frozenset(TRAINING_CATEGORIES[name]) - {'misc_other'}
+                  for name in TOP_NS}
+# requests are only cleaned the way the training set was if the model was fit
+# on exactly the TOP_NS categories of each col plus 'misc_other'
+_misfit_cols = [name for name, n in TOP_NS.items()
+                if 'misc_other' not in TRAINING_CATEGORIES[name]
+                or len(TOP_CATEGORIES[name]) != n]
+if _misfit_cols:
+    raise ValueError("model was not fit on the TOP_NS categories plus 'misc_other' "
+                     'of {}'.format(', '.join(_misfit_cols)))
+
+
+class CategoryCodePipeline:
+    '''
+    Predict with a fitted sentence pipeline (a ColumnTransformer one hot
+    encoding the categorical cols and passing the rest through, followed by
+    a regressor) without going through ColumnTransformer.transform.
+
+    Each categorical col is converted to pd.Categorical codes against the
+    categories its OneHotEncoder was fit on, and the ones are scattered
+    straight into the same sparse design matrix the transformer would build.
+    Unknown categories encode to all zeros (handle_unknown='ignore').
+
+    The regressor is already compiled XGBoost, so the matrix is handed to its
+    booster with inplace_predict, skipping the DMatrix the sklearn wrapper
+    builds on every predict call (except for early stopped models, see
+    __init__).
+
+    Raises a ValueError for a pipeline that is not laid out this way, as the
+    encoding would then silently differ from the pipeline's own.
+    '''
+    def __init__(self, pipeline):
+        if len(pipeline.steps) != 2:
+            raise ValueError('expected a (ColumnTransformer, regressor) pipeline')
+        ct = pipeline[0]
+        # names of the cols the transformer was fit on, in order
+        df_columns = getattr(ct, '_df_columns', None)
+        if df_columns is None:
+            raise ValueError('ColumnTransformer was not fit on a DataFrame')
+        # xgboost reads the zeros left out of a sparse matrix as missing
+        # values, so a dense pipeline would be scored differently
+        if not ct.sparse_output_:
+            raise ValueError('ColumnTransformer output is not sparse')
+        if len(ct.transformers_) != 2 or ct.remainder != 'passthrough':
+            raise ValueError('expected a OneHotEncoder and passthrough remainder')
+        (_, ohe, cat_cols), (_, remainder, passthrough) = ct.transformers_
+        if not isinstance(ohe, OneHotEncoder) or remainder != 'passthrough':
+            raise ValueError('expected a OneHotEncoder and passthrough remainder')
+        if ohe.drop is not None or ohe.handle_unknown != 'ignore':
+            raise ValueError("OneHotEncoder must have drop=None and handle_unknown='ignore'")
+        if not set(cat_cols) <= set(df_columns):
+            raise ValueError('OneHotEncoder cols must be given by name')
+        self.cat_cols = list(cat_cols)
+        self.cat_dtypes = [pd.CategoricalDtype(cats) for cats in ohe.categories_]
+        self.offsets = np.cumsum([0] + [len(cats) for cats in ohe.categories_])
+        self.passthrough_cols = [df_columns[i] for i in passthrough]
+        self.n_features = self.offsets[-1] + len(self.passthrough_cols)
+        self.estimator = pipeline[-1]
+        self.booster = self.estimator.get_booster()
+        # XGBRegressor.predict only uses the best_ntree_limit trees of a model
+        # fit with early stopping. inplace_predict ignores its iteration_range
+        # in xgboost 1.1, so such models are scored through the wrapper instead
+        self.ntree_limit = getattr(self.estimator, 'best_ntree_limit', 0)
+
+    def transform(self, data):
+        '''Encode data the way the pipeline's ColumnTransformer does.'''
+        rows, cols, values = [], [], []
+        for name, dtype, offset in zip(self.cat_cols, self.cat_dtypes, self.offsets):
+            # codes are int8 for small vocabularies, widen before offsetting
+            codes = pd.Categorical(data[name].values, dtype=dtype).codes.astype(np.intp)
+            known = np.flatnonzero(codes >= 0)
+            rows.append(known)
+            cols.append(codes[known] + offset)
+            values.append(np.ones(len(known)))
+        # the transformer stacks passthrough cols as sparse, dropping zeros
+        for i, name in enumerate(self.passthrough_cols, self.offsets[-1]):
+            col = data[name].values.astype(float)
+            nonzero = np.flatnonzero(col)
+            rows.append(nonzero)
+            cols.append(np.full(len(nonzero), i))
+            values.append(col[nonzero])
+        return sparse.csr_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(data.shape[0], self.n_features))
+
+    def predict(self, data):
+        X = self.transform(data)
+        if self.ntree_limit:
+            return self.estimator.predict(X)
+        return self.booster.inplace_predict(X)
+
+
+# scores requests with the same results as model.predict
+scoring_model = CategoryCodePipeline(model)
+
+
+def clean_data(data, removeColumns=True, top_categories=None):
+    '''
+    Prepare Cook County Sentencing data for predictive model.
+    Accepts multiple rows of data in pandas dataframe format.
+
+    Params:
+        data: (pd.DataFrame) Even if only one example/row is given, data is 
+        expected in 2-d data frame format.
+
+        top_categories: (dict) categories to keep in each of the TOP_NS cols,
+        all others are consolidated into 'misc_other'. If None, the TOP_NS
+        most frequent categories in data are kept, as when cleaning the
+        training set.
+
+    Returns: Cleaned df, if valid rows remain after cleaning. If no valid rows 
+        remain after cleaning a str message explaining what cleaning step 
+        removed the last valid row is returned.
+
+
+    TODO: restructure as a series of transformer objects that can be fit.
+    '''
+    # every cleaning step only rules out more examples, so the steps build up
+    # a single validity mask and the data is filtered once at the end. the
+    # mask is checked after each step to report which one removed the last
+    # valid row.
+
+    #### Exclude non-prison setences ####
+    # filter to only prison sentences (no jail or probation, etc...)
+    # JN some json strings may not have this field...if you clean the data before sending:
+    valid = (data['SENTENCE_TYPE'] == 'Prison').values
+
+    if not valid.any():
+        return 'INVALID: No Prison sentences found'
+
+    #### standardize race category names ####
+    race = _lookup(data['RACE'].values, RACE_INDEX, RACE_OUT)
+    # we can't compare racial outcomes if race is not known
+    # drop examples with races not not included in STANDARD_RACE_MAP.keys()
+    valid &= (race != 'Unknown') & pd.notnull(race)
+
+    if not valid.any():
+        return 'INVALID: No valid race values found'
+
+    #### standardize gender categories ####
+    gender = data['GENDER'].where(data['GENDER'].isin(['Male', 'Female']), 'Unknown').values
+
+    #### normalize commitment term to year units ####
+    # convert from object dtype
+    term = np.full(len(valid), np.nan)
+    term[valid] = data['COMMITMENT_TERM'][valid].astype(float).values
+
+    # filter out examples with non-standard commitment term units
+    unit = data['COMMITMENT_UNIT']
+    valid &= unit.isin(COMMITMENT_TERM_UNITS).values
+
+    # normalize commitment term to year units
+    term = term / _lookup(unit.values, TERM_DIVISOR_INDEX, TERM_DIVISOR_OUT)
+
+    # define natural life commitment term in years as the difference between the 
+    # median age of the indviduals committed to natural life terms at the time of 
+    # their offence and the us life expectancy
+    natural_life = (unit == 'Natural Life').values
+    age_when_committed = data.loc[valid & natural_life, 'AGE_AT_INCIDENT'].median()
+    natural_life_years = US_LIFE_EXPECTANCY - age_when_committed
+    # replace any value for commitment term where natural life is the unit to
+    # the estimated year equivalent
+    term = np.where(natural_life, natural_life_years, term)
+
+    if not valid.any():
+        return 'INVALID: No valid commitment term units found'
+
+    #### drop variables and examples with NULLS ####
+    if removeColumns:
+        data = data.drop(['SENTENCE_TYPE', 'COMMITMENT_UNIT'] + NAN_COLS, axis=1)
+    # drop examples with any nan! race, gender and commitment term are checked
+    # on their cleaned values
+    cleaned_cols = ['RACE', 'GENDER', 'COMMITMENT_TERM']
+    valid &= data.drop(cleaned_cols, axis=1).notnull().all(axis=1).values
+    valid &= pd.notnull(term)
+
+    if not valid.any():
+        return 'INVALID: No null-free examples found'
+
+    data = data.loc[valid, :]
+    data['RACE'] = race[valid]
+    data['GENDER'] = gender[valid]
+    data['COMMITMENT_TERM'] = term[valid]
+
+    #### reduce cardinality of high cardinality categories ####
+    if top_categories is None:
+        top_categories = {name: frozenset(data[name].value_counts().index[:n])
+                          for name, n in TOP_NS.items()}
+    # consolidate infrequent categories
+    for name, allowed in top_categories.items():
+        data[name] = data[name].where(data[name].isin(allowed), 'misc_other')
+
+    #### Clip range of COMMITMENT_TERM ####
+    # clip any all value above to 110 years 
+    data['COMMITMENT_TERM'] = data['COMMITMENT_TERM'].clip(upper=MAX_COMMITMENT_TERM)
+
+    # Set correct column order
+    # required by the sklearn ColumnTransformer used in the predict pipeline
+    # predict_cols = ['UPDATED_OFFENSE_CATEGORY', 'PRIMARY_CHARGE_FLAG',
+    #    'DISPOSITION_CHARGED_OFFENSE_TITLE', 'CHARGE_COUNT',
+    #    'DISPOSITION_CHARGED_CLASS', 'CHARGE_DISPOSITION', 'SENTENCE_JUDGE',
+    #    'SENTENCE_PHASE', 'COMMITMENT_TERM', 'AGE_AT_INCIDENT', 'RACE',
+    #    'GENDER', 'LAW_ENFORCEMENT_AGENCY']
+    # # assert all predict cols are same as cols in data
+    # assert len(np.intersect1d(predict_cols, data.columns)) == len(data.columns)
+    # data = data[predict_cols]
+
+    return data
+
+
+# cols of a payload that are not passed on to the model. clean_data keeps
+# COMMITMENT_TERM because it is the training target, but it is not a model input.
+DROPPED_COLS = frozenset(['SENTENCE_TYPE', 'COMMITMENT_UNIT', 'COMMITMENT_TERM'] + NAN_COLS)
+
+
+def clean_row(row):
+    '''
+    Single-row equivalent of clean_data(top_categories=TOP_CATEGORIES),
+    applying the same cleaning rules to a payload dict with plain Python
+    scalar operations instead of a series of DataFrame filters. Only the
+    values of the columns the model uses are returned, in ORIG_COLS order.
+
+    Params:
+        row: (dict) one example, already validated against PREDICT_SCHEMA
+
+    Returns: Tuple of the cleaned values if the example is valid, otherwise
+        the same str message clean_data would return.
+    '''
+    if row['SENTENCE_TYPE'] != 'Prison':
+        return 'INVALID: No Prison sentences found'
+
+    race = STANDARD_RACE_MAP.get(row['RACE'])
+    if race is None or race == 'Unknown':
+        return 'INVALID: No valid race values found'
+
+    gender = row['GENDER'] if row['GENDER'] in ('Male', 'Female') else 'Unknown'
+
+    # the commitment term is only validated: it is never scored, so there is
+    # no need to convert it to years or to estimate a natural life term
+    # the schema allows any string term, e.g. "Life", not just numeric ones,
+    # and ints too large for a float
+    try:
+        term = float(row['COMMITMENT_TERM'])
+    except (ValueError, OverflowError):
+        return 'INVALID: No valid commitment term values found'
+    unit = row['COMMITMENT_UNIT']
+    if unit not in COMMITMENT_TERM_UNITS:
+        return 'INVALID: No valid commitment term units found'
+    # clean_data replaces any natural life term, null or not
+    missing_term = pd.isnull(term) and unit != 'Natural Life'
+
+    cleaned = {k: v for k, v in row.items() if k not in DROPPED_COLS}
+    cleaned['RACE'] = race
+    cleaned['GENDER'] = gender
+    if missing_term or any(pd.isnull(v) for v in cleaned.values()):
+        return 'INVALID: No null-free examples found'
+
+    for name, allowed in TOP_CATEGORIES.items():
+        if cleaned[name] not in allowed:
+            cleaned[name] = 'misc_other'
+
+    # in the col order the pipeline's ColumnTransformer expects
+    return tuple(cleaned[name] for name in ORIG_COLS)
+
+
+def _counterfactual_race(race):
+    '''Map an array of races to their counterfactuals with a numpy gather.'''
+    codes = pd.Categorical(race, dtype=RACE_CATS).codes
+    return RACE_CATS_OUT[CF_PERM[codes]]
+
+
+def make_counterfactual(data):
+    '''Take data and switch race variable to "opposite" value'''
+    data_counterfactual = data.copy()
+    data_counterfactual['RACE'] = _counterfactual_race(data['RACE'].values)
+    return data_counterfactual
+
+
+def estimate_discrepancy(model, data, return_pred=False):
+    '''
+    Estimate discrepancy in sentence length if race were switched.
+    
+    The discrepancy estimate represents # of additional years to which the
+    actual profile would be sentenced over the counterfactual profile. A 
+    positive discrepancy means that the actual race would recieve a 
+    harsher sentence than the counterfactual race.
+
+    Params:
+        return_pred: (bool) if True, returns a tuple of 
+            (descrepancy, prediction), otherwise just returns descrepancy
+
+    Returns:
+        discrepancy is a 1-d numpy array
+    '''
+    # score actual and counterfactual profiles in a single batch so the
+    # pipeline's transform and predict steps only run once. the stacked frame
+    # is already a fresh copy, so only its RACE col is rewritten rather than
+    # copying data once more in make_counterfactual
+    n = data.shape[0]
+    combined = pd.concat([data, data], axis=0, ignore_index=True)
+    race = data['RACE'].values
+    combined['RACE'] = np.concatenate([race, _counterfactual_race(race)])
+    diff, pred = _split_discrepancy(model.predict(combined), n)
+    if return_pred:
+        return diff, pred
+
+    return diff
+
+
+def score_row(row, model=scoring_model):
+    '''
+    Estimate discrepancy and prediction for one cleaned example, as
+    estimate_discrepancy(model, data, return_pred=True) does for a frame.
+
+    Params:
+        row: (tuple) cleaned example in ORIG_COLS order, as returned by
+            clean_row
+
+    Returns:
+        (discrepancy, prediction) as 1-d numpy arrays of length 1
+    '''
+    # the example and its counterfactual are built straight into one frame
+    i = ORIG_COLS.get_loc('RACE')
+    counterfactual = row[:i] + tuple(_counterfactual_race([row[i]])) + row[i + 1:]
+    data = pd.DataFrame([row, counterfactual], columns=ORIG_COLS)
+    return _split_discrepancy(model.predict(data), 1)
+
+
+def _split_discrepancy(preds, n):
+    '''
+    Split predictions for n examples followed by their counterfactuals into
+    (discrepancy, prediction).
+    '''
+    pred = preds[:n]
+    return pred - preds[n:], pred
+
+
+# test_discrepancies = load_test_discrepancies('../saved_models/test_data_percentage_discrepancies.json')
+# new_discrepancy = np.array([0.07335617], dtype='float32')
+def discrepancy_percentile(new_discrepancy, test_discrepancies):
+    '''
+    Calculate how extreme of a percentage discrepancy is observed in the 
+    new discrepancy compared to a saved test set of percentage discrepancies.
+
+    Params:
+        new_discrepancy: (float or 1-d array-like) percentage discrepancy(ies)
+        (btw 0 and inf) to calculate percentile of. Any number of
+        discrepancies can be scored in one call.
+
+
+        test_discrepancies: (1-d numpy array) sorted magnitudes of test set
+        percentage discrepancies, as returned by load_test_discrepancies.
+    
+    Returns:
+        percentile: a number (btw 0 and 100) representing what percent of 
+        test discrepancies are smaller than the new_discrepancy.
+
+    '''
+    n = len(test_discrepancies)
+
+    # take absolute value to compare only magnitude of discrepancies. the
+    # values are cast to the dtype of the test discrepancies (float64 from
+    # load_test_discrepancies), otherwise searchsorted would cast a copy of
+    # the whole test set to a common dtype on every call
+    new_discrepancy = np.abs(np.asarray(new_discrepancy, dtype=test_discrepancies.dtype))
+    # number of test discrepancies strictly smaller than each new discrepancy
+    smaller = np.searchsorted(test_discrepancies, new_discrepancy, side='left')
+    # searchsorted places nan after every value, but nan is not larger than any
+    smaller = np.where(np.isnan(new_discrepancy), 0, smaller)
+    percentile = (smaller / n) * 100
+    return percentile
+
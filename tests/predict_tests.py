@@ -0,0 +1,247 @@
+from server import app
+from server.predict_core import (ORIG_COLS, PREDICT_SCHEMA, TEST_DISCREPANCIES,
+                                 TOP_CATEGORIES, CategoryCodePipeline, clean_data,
+                                 clean_row, discrepancy_percentile, estimate_discrepancy,
+                                 model, score_row, scoring_model, validate_payload)
+from schema import SchemaError
+import copy
+import numpy as np
+import pandas as pd
+import unittest
+
+# sample request payload, as documented in server/routes/predict.py
+PAYLOAD = {
+    'UPDATED_OFFENSE_CATEGORY': 'PROMIS Conversion',
+    'PRIMARY_CHARGE_FLAG': True,
+    'DISPOSITION_CHARGED_OFFENSE_TITLE': 'ARMED ROBBERY',
+    'CHARGE_COUNT': 1,
+    'DISPOSITION_CHARGED_CLASS': 'X',
+    'CHARGE_DISPOSITION': 'Plea Of Guilty',
+    'SENTENCE_JUDGE': 'James L Rhodes',
+    'SENTENCE_PHASE': 'Original Sentencing',
+    'SENTENCE_TYPE': 'Prison',
+    'COMMITMENT_TERM': 10.0,
+    'COMMITMENT_UNIT': 'Year(s)',
+    'LENGTH_OF_CASE_in_Days': 1307.0,
+    'AGE_AT_INCIDENT': 17.0,
+    'RACE': 'Black',
+    'GENDER': 'Male',
+    'INCIDENT_CITY': None,
+    'LAW_ENFORCEMENT_AGENCY': 'PROMIS Data Conversion',
+    'LAW_ENFORCEMENT_UNIT': None
+}
+
+
+# one of the top SENTENCE_JUDGE categories the model was fit on
+KNOWN_JUDGE = 'Alfredo  Maldonado'
+
+
+def payload(**kwargs):
+    '''Copy of PAYLOAD with the given fields replaced.'''
+    return dict(PAYLOAD, **kwargs)
+
+
+class PredictRouteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # create a test client
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def test_predict(self):
+        result = self.app.post('/predict', json=PAYLOAD)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(sorted(result.get_json()),
+                         ['model_name', 'sentencing_discrepancy', 'severity'])
+
+    def test_predict_matches_model(self):
+        for row in [PAYLOAD, payload(SENTENCE_JUDGE=KNOWN_JUDGE, RACE='White'),
+                    payload(RACE='HISPANIC', GENDER='Female', CHARGE_COUNT=0)]:
+            with self.subTest(row=row):
+                data = clean_data(pd.DataFrame([row]), top_categories=TOP_CATEGORIES)
+                discrepancy, prediction = estimate_discrepancy(model, data[ORIG_COLS],
+                                                               return_pred=True)
+                percentile = discrepancy_percentile(discrepancy / prediction, TEST_DISCREPANCIES)
+                result = self.app.post('/predict', json=row).get_json()
+                self.assertEqual(result['sentencing_discrepancy'], round(float(discrepancy[0]), 3))
+                self.assertEqual(result['severity'], round(float(percentile[0]), 3))
+
+    def test_invalid_example(self):
+        result = self.app.post('/predict', json=payload(SENTENCE_TYPE='Probation'))
+        self.assertEqual(result.status_code, 404)
+        self.assertEqual(result.get_json()['message'],
+                         'DATA ERROR: INVALID: No Prison sentences found')
+
+    def test_non_numeric_commitment_term(self):
+        for term in ['Life', 10 ** 400]:
+            with self.subTest(term=term):
+                result = self.app.post('/predict', json=payload(COMMITMENT_TERM=term))
+                self.assertEqual(result.status_code, 404)
+                self.assertEqual(result.get_json()['message'],
+                                 'DATA ERROR: INVALID: No valid commitment term values found')
+
+
+class CleanRowTestCase(unittest.TestCase):
+
+    def assert_cleaned_like_clean_data(self, row):
+        expected = clean_data(pd.DataFrame({k: [v] for k, v in row.items()}),
+                              top_categories=TOP_CATEGORIES)
+        cleaned = clean_row(row)
+        if isinstance(expected, str):
+            self.assertEqual(cleaned, expected)
+        else:
+            self.assertEqual(cleaned, tuple(expected[ORIG_COLS].iloc[0]))
+
+    def test_matches_clean_data(self):
+        for row in [PAYLOAD,
+                    payload(SENTENCE_JUDGE=KNOWN_JUDGE),
+                    payload(COMMITMENT_UNIT='Natural Life', COMMITMENT_TERM='1'),
+                    payload(COMMITMENT_UNIT='Natural Life', COMMITMENT_TERM=np.nan),
+                    payload(COMMITMENT_UNIT='Months', COMMITMENT_TERM=30),
+                    payload(COMMITMENT_UNIT='Days', COMMITMENT_TERM='400'),
+                    payload(COMMITMENT_TERM=np.nan),
+                    payload(COMMITMENT_TERM='nan'),
+                    payload(COMMITMENT_UNIT='Weeks'),
+                    payload(SENTENCE_TYPE='Probation'),
+                    payload(RACE='White [Hispanic or Latino]'),
+                    payload(RACE='Unknown'),
+                    payload(RACE='Martian'),
+                    payload(GENDER='X'),
+                    payload(AGE_AT_INCIDENT=np.nan),
+                    payload(SENTENCE_JUDGE='Nobody', LAW_ENFORCEMENT_AGENCY='Nowhere PD',
+                            UPDATED_OFFENSE_CATEGORY='Jaywalking',
+                            DISPOSITION_CHARGED_OFFENSE_TITLE='JAYWALKING')]:
+            with self.subTest(row=row):
+                self.assert_cleaned_like_clean_data(row)
+
+    def test_unseen_categories_are_misc_other(self):
+        judge = list(ORIG_COLS).index('SENTENCE_JUDGE')
+        self.assertEqual(clean_row(payload(SENTENCE_JUDGE=KNOWN_JUDGE))[judge], KNOWN_JUDGE)
+        self.assertEqual(clean_row(payload(SENTENCE_JUDGE='Nobody'))[judge], 'misc_other')
+
+
+class ScoreRowTestCase(unittest.TestCase):
+
+    def test_matches_estimate_discrepancy(self):
+        for row in [payload(SENTENCE_JUDGE=KNOWN_JUDGE), payload(RACE='White'),
+                    payload(RACE='ASIAN', CHARGE_COUNT=0, PRIMARY_CHARGE_FLAG=False)]:
+            with self.subTest(row=row):
+                cleaned = clean_row(row)
+                data = pd.DataFrame([cleaned], columns=ORIG_COLS)
+                expected = estimate_discrepancy(model, data, return_pred=True)
+                for result, value in zip(score_row(cleaned), expected):
+                    np.testing.assert_array_equal(result, value)
+
+
+class CleanDataTestCase(unittest.TestCase):
+
+    def test_clean_data(self):
+        rows = [
+            payload(COMMITMENT_UNIT='Months', COMMITMENT_TERM=24),
+            payload(COMMITMENT_UNIT='Days', COMMITMENT_TERM='730', RACE='White [Hispanic or Latino]'),
+            payload(COMMITMENT_UNIT='Natural Life', COMMITMENT_TERM=1, AGE_AT_INCIDENT=30.),
+            payload(COMMITMENT_UNIT='Natural Life', COMMITMENT_TERM=1, AGE_AT_INCIDENT=40.),
+            payload(COMMITMENT_TERM=500, GENDER='X', SENTENCE_JUDGE='Nobody'),
+            # invalid examples, the probation one is not counted in the
+            # median age of natural life examples
+            payload(SENTENCE_TYPE='Probation', COMMITMENT_UNIT='Natural Life',
+                    AGE_AT_INCIDENT=90.),
+            payload(RACE='Unknown'),
+            payload(RACE='Martian'),
+            payload(COMMITMENT_UNIT='Weeks'),
+            payload(AGE_AT_INCIDENT=None),
+        ]
+        data = pd.DataFrame(rows)
+        data.loc[:3, 'SENTENCE_JUDGE'] = KNOWN_JUDGE
+        original = data.copy()
+        cleaned = clean_data(data, top_categories=TOP_CATEGORIES)
+
+        pd.testing.assert_frame_equal(data, original)
+        self.assertEqual(list(cleaned.index), [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(cleaned.columns), sorted(list(ORIG_COLS) + ['COMMITMENT_TERM']))
+        # natural life is 78 years less the median age of 35
+        self.assertEqual(list(cleaned['COMMITMENT_TERM']), [2., 2., 43., 43., 110.])
+        self.assertEqual(list(cleaned['RACE']), ['Black', 'HISPANIC', 'Black', 'Black', 'Black'])
+        self.assertEqual(list(cleaned['GENDER']), ['Male'] * 4 + ['Unknown'])
+        self.assertEqual(list(cleaned['SENTENCE_JUDGE']), [KNOWN_JUDGE] * 4 + ['misc_other'])
+
+    def test_invalid_messages(self):
+        for row, message in [
+                (payload(SENTENCE_TYPE='Probation'), 'INVALID: No Prison sentences found'),
+                (payload(RACE='Unknown'), 'INVALID: No valid race values found'),
+                (payload(COMMITMENT_UNIT='Weeks'), 'INVALID: No valid commitment term units found'),
+                (payload(AGE_AT_INCIDENT=None), 'INVALID: No null-free examples found')]:
+            with self.subTest(row=row):
+                self.assertEqual(clean_data(pd.DataFrame([row])), message)
+
+
+class ValidatePayloadTestCase(unittest.TestCase):
+
+    def test_matches_schema(self):
+        missing = dict(PAYLOAD)
+        del missing['RACE']
+        for data in [PAYLOAD, payload(CHARGE_COUNT='1'), payload(CHARGE_COUNT=True),
+                     payload(PRIMARY_CHARGE_FLAG=1), payload(COMMITMENT_TERM='10'),
+                     payload(COMMITMENT_TERM=''), payload(RACE=''), payload(AGE_AT_INCIDENT=None),
+                     payload(INCIDENT_CITY='Chicago'), payload(EXTRA=1), missing,
+                     [PAYLOAD], None]:
+            with self.subTest(data=data):
+                try:
+                    expected = PREDICT_SCHEMA.validate(data)
+                except SchemaError:
+                    self.assertRaises(SchemaError, validate_payload, data)
+                else:
+                    self.assertEqual(validate_payload(data), expected)
+
+
+class CategoryCodePipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        example = dict(clean_data(pd.DataFrame([payload(SENTENCE_JUDGE=KNOWN_JUDGE)]),
+                                  top_categories=TOP_CATEGORIES)[ORIG_COLS].iloc[0])
+        self.data = pd.DataFrame([
+            example,
+            dict(example, RACE='White', GENDER='Female'),
+            # categories the encoder was not fit on are encoded as all zeros
+            dict(example, SENTENCE_PHASE='Unheard Of', DISPOSITION_CHARGED_CLASS='Z'),
+            # zero valued passthrough cols are left out of the sparse matrix
+            dict(example, CHARGE_COUNT=0, PRIMARY_CHARGE_FLAG=False, AGE_AT_INCIDENT=0.),
+        ], columns=ORIG_COLS)
+
+    def test_transform_matches_pipeline(self):
+        expected = model[0].transform(self.data).tocsr()
+        encoded = scoring_model.transform(self.data).tocsr()
+        expected.sort_indices()
+        encoded.sort_indices()
+        self.assertEqual(encoded.shape, expected.shape)
+        np.testing.assert_array_equal(encoded.indptr, expected.indptr)
+        np.testing.assert_array_equal(encoded.indices, expected.indices)
+        np.testing.assert_array_equal(encoded.data, expected.data)
+
+    def test_predict_matches_pipeline(self):
+        np.testing.assert_array_equal(scoring_model.predict(self.data), model.predict(self.data))
+
+    def test_predict_uses_best_ntree_limit(self):
+        # as set on a regressor fit with early stopping
+        pipeline = copy.deepcopy(model)
+        pipeline[-1].best_ntree_limit = 10
+        predictions = CategoryCodePipeline(pipeline).predict(self.data)
+        np.testing.assert_array_equal(predictions, pipeline.predict(self.data))
+        self.assertFalse(np.array_equal(predictions, model.predict(self.data)))
+
+    def test_rejects_other_pipelines(self):
+        def dense(ct, ohe):
+            ct.sparse_output_ = False
+        def drop_first(ct, ohe):
+            ohe.drop = 'first'
+        def unknown_error(ct, ohe):
+            ohe.handle_unknown = 'error'
+        for change in [dense, drop_first, unknown_error]:
+            with self.subTest(change=change.__name__):
+                pipeline = copy.deepcopy(model)
+                change(pipeline[0], pipeline[0].transformers_[0][1])
+                self.assertRaises(ValueError, CategoryCodePipeline, pipeline)
+
+
+if __name__ == '__main__':
+    unittest.main()